@@ -1,46 +1,68 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import JSONResponse, ORJSONResponse
 from typing import List
-from library import Library, BookRequest, BookResponse, normalize_isbn
+from library import (Library, BookRequest, BookResponse, BatchRequest, BatchResult,
+                     normalize_isbn, is_valid_isbn, close_http_client, json_dumps, orjson)
+import uvicorn
+
+# orjson is faster, the standard json module is used when it is not installed (library.orjson is None)
+ResponseClass = ORJSONResponse if orjson is not None else JSONResponse
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Close the shared Open Library client and write pending changes when the server shuts down
+    await close_http_client()
+    library.close()
 
 # Create FastAPI application
+# Responses are serialized with orjson (when installed) instead of jsonable_encoder + stdlib json
 app = FastAPI(
     title="Library API",
     description="API for library management",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ResponseClass,
+    lifespan=lifespan
 )
 
 # Same file from step 1 and 2 
 library = Library("library.json")
 
+def book_to_response(book) -> dict:
+    # Convert a Book object to a plain dict with the BookResponse fields
+    # Books are validated when they are added, so the response skips Pydantic validation
+    return {
+        "title": book.title,
+        "author": book.author,
+        "isbn": book.isbn,
+        "publication_year": book.publication_year,
+        "book_type": book.book_type
+    }
+
 @app.get("/")
 # Root endpoind prints a welcome message to confirm API is running
 async def root():
     return {"message": "Welcome to the library API!"}
 
-@app.get("/books", response_model=List[BookResponse])
+# Response models are only used for the documentation, the endpoints return ResponseClass directly
+@app.get("/books", responses={200: {"model": List[BookResponse]}})
 async def get_books():
     # Lists all book from library
-    books = []
-    # Convert Book objects in library to BookResponse model for API response
-    for book in library._books:
-        books.append(BookResponse(
-            title=book.title,
-            author=book.author,
-            isbn=book.isbn,
-            publication_year=book.publication_year,
-            book_type=book.book_type
-        ))
-    return books
-
-@app.post("/books", response_model=BookResponse)
+    # The serialized list is cached on the library until a book is added or removed
+    if library._books_cache is None:
+        library._books_cache = json_dumps([book_to_response(book) for book in library.books])
+    return Response(content=library._books_cache, media_type="application/json")
+
+@app.post("/books", responses={200: {"model": BookResponse}})
 async def add_book(book_request: BookRequest):
     # Add book by ISBN
 
     clean_isbn = normalize_isbn(book_request.isbn)
-    if len(clean_isbn) not in (10, 13):
+    if not is_valid_isbn(clean_isbn):
         raise HTTPException(
             status_code=422,
-            detail="ISBN must be either 10 or 13 characters long."
+            detail="ISBN must be either 10 or 13 characters long with a valid check digit."
         )
     
     # Check if book is already in the library
@@ -52,22 +74,28 @@ async def add_book(book_request: BookRequest):
         )
     
     # Fetch book information from API and add to library
-    success = library.add_book_by_isbn(book_request.isbn)
-    if not success:
+    added_book = await library.add_book_by_isbn(clean_isbn)
+    # The same book may have been added by another request while this one waited for Open Library
+    if added_book is None and library.find_book(clean_isbn):
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Book with ISBN {book_request.isbn} already exists in the library."
+        )
+    if added_book is None:
         raise HTTPException(
             status_code=404, 
             detail="Book with ISBN not found or could not be retrieved."
         )
     
-    # Find the book that is added and return it
-    added_book = library.find_book(clean_isbn)
-    return BookResponse(
-        title=added_book.title,
-        author=added_book.author,
-        isbn=added_book.isbn,
-        publication_year=added_book.publication_year,
-        book_type=added_book.book_type
-    )
+    # Return the book that is added
+    return ResponseClass(book_to_response(added_book))
+
+@app.post("/books/batch", responses={200: {"model": List[BatchResult]}})
+async def add_books_batch(batch_request: BatchRequest):
+    # Add several books by ISBN in one request
+    # Each ISBN gets its own status instead of failing the whole batch
+    results = await library.add_books_by_isbn(batch_request.isbns)
+    return ResponseClass(results)
 
 @app.delete("/books/{isbn}")
 async def delete_book(isbn: str):
@@ -87,7 +115,7 @@ async def delete_book(isbn: str):
     library.remove_book(clean_isbn)
     return {"message": f"Book with ISBN {isbn} deleted"}
 
-@app.get("/books/{isbn}", response_model=BookResponse)
+@app.get("/books/{isbn}", responses={200: {"model": BookResponse}})
 async def get_book(isbn: str):
     # Get a specific book by ISBN
     clean_isbn =  normalize_isbn(isbn)
@@ -101,11 +129,15 @@ async def get_book(isbn: str):
         )
     
     # Return book information
-    return BookResponse(
-        title=book.title,
-        author=book.author,
-        isbn=book.isbn,
-        publication_year=book.publication_year,
-        book_type=book.book_type
-    )
+    return ResponseClass(book_to_response(book))
+
+def run_server(host: str = "127.0.0.1", port: int = 8000, workers: int = 1):
+    # Start the API server with uvloop and httptools, which uvicorn picks automatically when
+    # they are installed (uvicorn[standard] in requirements.txt)
+    # The library is kept in the memory of the process, so every worker would have its own copy
+    # and they would overwrite each other's changes; only use more workers for read-only libraries
+    uvicorn.run("api:app", host=host, port=port, workers=workers, loop="auto", http="auto")
+
+if __name__ == "__main__":
+    run_server()
 
@@ -1,49 +1,174 @@
+from collections import OrderedDict
+from contextlib import contextmanager
 from enum import IntEnum
 from pydantic import BaseModel, Field
+from typing import List
+import asyncio
 import httpx
 import json
+import operator
+import os
+import atexit
+import queue
+import sqlite3
+import sys
+import threading
+import weakref
+
+# orjson is faster, the standard json module is used when it is not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_dumps(obj) -> bytes:
+    # Encode an object to compact UTF-8 JSON bytes
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def json_loads(data: bytes):
+    # Decode JSON bytes, both decoders raise json.JSONDecodeError on invalid input
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def normalize_isbn(isbn: str) -> str:
+    # Helper function to clean ISBN from spaces and hyphens
+    # str.replace returns the same string when there is nothing to remove, so already clean
+    # ISBNs (e.g. every ISBN in a saved library) are not copied
+    isbn = isbn.replace("-", "").replace(" ", "")
+    # An ISBN-10 check digit of 10 is written as 'X', lowercase 'x' is the same ISBN
+    if isbn.endswith("x"):
+        isbn = isbn[:-1] + "X"
+    return isbn
+
+# Check digit weights for ISBN-10 and ISBN-13
+_ISBN10_WEIGHTS = (10, 9, 8, 7, 6, 5, 4, 3, 2, 1)
+_ISBN13_WEIGHTS = (1, 3) * 6 + (1,)
+
+def is_valid_isbn(isbn: str) -> bool:
+    # Check the length and check digit of a normalized ISBN-10 or ISBN-13
+    if not isbn.isascii():
+        return False
+    if len(isbn) == 10:
+        # The last character of an ISBN-10 can be 'X', which stands for 10
+        if not isbn[:9].isdigit() or not (isbn[9].isdigit() or isbn[9] in "Xx"):
+            return False
+        digits = [int(c) for c in isbn[:9]]
+        digits.append(10 if isbn[9] in "Xx" else int(isbn[9]))
+        return sum(map(operator.mul, digits, _ISBN10_WEIGHTS)) % 11 == 0
+    if len(isbn) == 13 and isbn.isdigit():
+        return sum(map(operator.mul, map(int, isbn), _ISBN13_WEIGHTS)) % 10 == 0
+    return False
+
+def intern_str(value):
+    # Intern repeated strings such as author names so equal values share one object;
+    # optional fields (e.g. an ebook without a file format) can be None
+    return sys.intern(value) if isinstance(value, str) else value
 
 # Represents a book in the library
 class Book:
+    # Fixed attribute slots instead of a per-instance __dict__ (less memory, faster access)
+    __slots__ = ('title', 'author', 'isbn', 'publication_year')
+    # The type is the same for every book of a class, so it is a class attribute
+    book_type = 'Book'
+
     def __init__(self, title: str, author: str, isbn: str, publication_year: int):
         self.title = title
         self.author = author
-        self.isbn = isbn
+        self.isbn = normalize_isbn(isbn) # Normalized once, so lookups can compare directly
         self.publication_year = publication_year
-        self.book_type = 'Book'
 
     # Overriding __str__ method
     def __str__(self):
         return f"'{self.title}' by {self.author} (ISBN: {self.isbn}, Publication year: {self.publication_year})"
+
+    # Create a book from its dictionary form
+    @classmethod
+    def from_dict(cls, data: dict):
+        # Authors repeat across many books, so loaded names are interned to share one string each
+        return cls(data["title"], intern_str(data["author"]), data["isbn"], data["publication_year"])
+
+    # Dictionary form of the book, used when saving it to JSON
+    def to_dict(self) -> dict:
+        return {
+            "title": self.title,
+            "author": self.author,
+            "isbn": self.isbn,
+            "publication_year": self.publication_year,
+            "book_type": self.book_type
+        }
     
 
 # Represents an ebook in the library, subclass of Book
 class EBook(Book):
+    __slots__ = ('file_format',)
+    book_type = 'EBook'
+
     def __init__(self, title: str, author: str, isbn: str, publication_year: int, file_format: str):
         super().__init__(title, author, isbn, publication_year)
         self.file_format = file_format
-        self.book_type = 'EBook'
 
     # Overriding __str__ method of the superclass
     def __str__(self):
         return f"{super().__str__()} [Format: {self.file_format}]"
 
+    # Overriding from_dict to read the eBook-specific attribute
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["title"], intern_str(data["author"]), data["isbn"], data["publication_year"],
+                   intern_str(data["file_format"]))
+
+    # Adding the eBook-specific attribute to the dictionary of the superclass
+    def to_dict(self) -> dict:
+        data = super().to_dict()
+        data["file_format"] = self.file_format
+        return data
+
 
 # Represents an audio book in the library, subclass of Book
 class AudioBook(Book):
+    __slots__ = ('duration_min',)
+    book_type = 'AudioBook'
+
     def __init__(self, title: str, author: str, isbn: str, publication_year: int, duration_min: int):
         super().__init__(title, author, isbn, publication_year)
         self.duration_min = duration_min
-        self.book_type = 'AudioBook'
     
     # Overriding __str__ method of the superclass
     def __str__(self):
         return f"{super().__str__()} [Duration: {self.duration_min} mins]"
 
+    # Overriding from_dict to read the audiobook-specific attribute
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["title"], intern_str(data["author"]), data["isbn"], data["publication_year"], data["duration_min"])
+
+    # Adding the audiobook-specific attribute to the dictionary of the superclass
+    def to_dict(self) -> dict:
+        data = super().to_dict()
+        data["duration_min"] = self.duration_min
+        return data
+
+# Book classes by their book_type, unknown or missing types are loaded as Book
+BOOK_CLASSES = {cls.book_type: cls for cls in (Book, EBook, AudioBook)}
+
+def book_from_dict(item: dict) -> Book:
+    # Create the object of the according book type from a saved dictionary
+    # A single dict lookup replaces comparing the type against every class
+    return BOOK_CLASSES.get(item.get("book_type"), Book).from_dict(item)
+
+def author_keys(author: str) -> set:
+    # Lowercased author string and, for comma-separated authors, each individual author
+    key = author.lower()
+    return {key, *(name.strip() for name in key.split(",") if name.strip())}
+
 # Request and Response Models 
 class BookRequest(BaseModel):
+    # The pattern is checked by pydantic-core, so malformed ISBNs are rejected before the endpoint runs
     isbn: str = Field(..., description="ISBN number (must be 10 or 13 characters):",
-                min_length=10, max_length=13)
+                min_length=10, max_length=13, pattern=r"^[0-9Xx \-]+$")
 
 class BookResponse(BaseModel):
     title: str
@@ -51,6 +176,17 @@ class BookResponse(BaseModel):
     isbn: str
     publication_year: int
     book_type: str = "Book"
+
+# Largest number of ISBNs accepted in one batch request
+MAX_BATCH_SIZE = 100
+
+class BatchRequest(BaseModel):
+    isbns: List[str] = Field(..., description="ISBN numbers of the books to add",
+                min_length=1, max_length=MAX_BATCH_SIZE)
+
+class BatchResult(BaseModel):
+    isbn: str
+    status: str # "added", "exists", "invalid" or "not_found"
     
 # Pydantic Model
 class BookModel(BaseModel):
@@ -71,25 +207,121 @@ class HTTPStatusCodes(IntEnum):
     NOT_FOUND = 404
     UNPROCESSABLE_ENTITY = 422
 
-def normalize_isbn(isbn: str) -> str:
-    # Helper function to clean ISBN from spaces and hyphens
-    return isbn.replace("-", "").replace(" ", "")
+# Shared Open Library client, created on first use so connections are reused between requests
+_http_client = None
+# Successful Open Library lookups by ISBN, least recently used first
+_fetch_cache = OrderedDict()
+FETCH_CACHE_SIZE = 4096
+# Largest number of Open Library lookups a batch runs at the same time
+FETCH_CONCURRENCY = 10
+
+def get_http_client() -> httpx.AsyncClient:
+    # Return the shared client, creating a new one if there is none or it was closed
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=10.0, limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+    return _http_client
+
+async def close_http_client():
+    # Close the shared client (e.g. when the API server shuts down)
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+# Library names ending with one of these are stored in SQLite instead of a JSON file
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+_INSERT_BOOK = ("INSERT OR REPLACE INTO books "
+                "(isbn, title, author, publication_year, book_type, file_format, duration_min) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+def open_book_db(path: str) -> sqlite3.Connection:
+    # Open a SQLite library, creating the books table if needed
+    # check_same_thread is off because the API uses the library from another thread than the one that created it
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    # WAL mode appends changes to a log file instead of rewriting pages in place
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("""CREATE TABLE IF NOT EXISTS books (
+        isbn TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        author TEXT NOT NULL,
+        publication_year INTEGER,
+        book_type TEXT NOT NULL,
+        file_format TEXT,
+        duration_min INTEGER
+    )""")
+    return db
+
+def book_row(data: dict) -> tuple:
+    # Values of a book dictionary in the column order of _INSERT_BOOK
+    return (data["isbn"], data["title"], data["author"], data["publication_year"],
+            data["book_type"], data.get("file_format"), data.get("duration_min"))
+
+# Libraries with writes queued for their writer thread, flushed before the interpreter exits;
+# weak references, so a library that is no longer used can still be freed
+_libraries_to_flush = weakref.WeakSet()
+
+@atexit.register
+def _flush_libraries():
+    for library in list(_libraries_to_flush):
+        library.flush()
 
 # Represents a library class
 class Library:
     def __init__(self, lib_name: str):
-        self.lib_name = lib_name # JSON file name
-        self._books = [] # _ means encapsulation 
-        self.load_books() # Books are loaded when the library is initialized
-
-
-    def fetch_book_from_api(self, isbn: str):
+        # JSON file name, or SQLite database name (see SQLITE_SUFFIXES);
+        # None keeps the library in memory only, e.g. for tests (Library(lib_name=None)); there is
+        # no default, so forgetting the file name is an error instead of a library that is never saved
+        self.lib_name = lib_name
+        # SQLite connection, None when the library is stored in a JSON file
+        self._db = None
+        # Append-only journal of changes since the last save, None for an in-memory library
+        self._log_name = f"{lib_name}.log" if lib_name is not None else None
+        self._log_ops = 0 # Number of changes in the journal
+        # _ means encapsulation
+        # Normalized ISBN -> Book, for O(1) lookups; dicts keep insertion order, so this is also
+        # the list of books and a book can be removed without shifting a list
+        self._index = {}
+        # Lowercased author / book type -> {ISBN: Book}, dicts so a book is removed in O(1)
+        # while the books stay in the order they were added
+        self._by_author = {}
+        self._by_type = {}
+        self._books_cache = None # Serialized book list for the API, reset when books change
+        self._write_q = queue.Queue() # Pending file writes for the background writer thread
+        self._writer = None # Writer thread, started when a write is queued and stopped when idle
+        self._writer_lock = threading.Lock() # Guards starting and stopping the writer thread
+        self._batch_depth = 0 # Number of open batch() blocks
+        self._batch_records = [] # Changes held back until the outermost batch() block ends
+        self._loaded = False # Books are loaded on first use, not when the library is initialized
+
+    @property
+    def books(self) -> list:
+        # All books in the order they were added, as a new list
+        self._ensure_loaded()
+        return list(self._index.values())
+
+    def _ensure_loaded(self):
+        # Load the books the first time they are needed, so creating a Library does not read its file
+        if not self._loaded:
+            self.load_books()
+
+    async def fetch_book_from_api(self, isbn: str):
         # Fetch book information from Open Library search.json API using ISBN
 
         OPEN_LIBRARY_URL = "https://openlibrary.org/search.json"
+        clean_isbn = normalize_isbn(isbn)
+        # Repeated lookups of the same ISBN are answered from the cache
+        if clean_isbn in _fetch_cache:
+            _fetch_cache.move_to_end(clean_isbn)
+            return dict(_fetch_cache[clean_isbn])
+
         try:
-            clean_isbn = normalize_isbn(isbn)
-            response = httpx.get(OPEN_LIBRARY_URL, params={"isbn": clean_isbn}, timeout=10.0)
+            response = await get_http_client().get(OPEN_LIBRARY_URL, params={"isbn": clean_isbn})
             response.raise_for_status()
             data = response.json()
 
@@ -104,13 +336,19 @@ class Library:
             author = ", ".join(author_names) if author_names else "Unknown Author" 
             publication_year = book_info.get("first_publish_year", None)
 
-            # Return the book information as a dictionary
-            return {
+            # Cache the book information, dropping the least recently used entry when full
+            book_data = {
                 "title": title,
                 "author": author,
                 "isbn": clean_isbn,
                 "publication_year": publication_year
             }
+            _fetch_cache[clean_isbn] = book_data
+            if len(_fetch_cache) > FETCH_CACHE_SIZE:
+                _fetch_cache.popitem(last=False)
+
+            # Return the book information as a dictionary
+            return dict(book_data)
 
         # Error handling
         except httpx.RequestError as e:
@@ -123,23 +361,31 @@ class Library:
             print(f"Unexpected error: {e}")
             return None
 
-    def add_book_by_isbn(self, isbn: str, book_type: str = "Book", **kwargs):
+    async def add_book_by_isbn(self, isbn: str, book_type: str = "Book", **kwargs):
         # **kwargs: Additional parameters depending on book type (e.g: audiobook, ebook)
+        # Returns the added book, or None if it could not be added
+        self._ensure_loaded()
         clean_isbn = normalize_isbn(isbn)
-        if len(clean_isbn) not in (10, 13):
-            print(f"Invalid ISBN: {isbn}. ISBN must be 10 or 13 characters.")
-            return False
+        # Invalid ISBNs are rejected before asking Open Library
+        if not is_valid_isbn(clean_isbn):
+            print(f"Invalid ISBN: {isbn}. ISBN must be 10 or 13 characters with a valid check digit.")
+            return None
         
         # Check if book is already in the library
-        if self.find_book(clean_isbn):
+        if clean_isbn in self._index:
             print(f"Book with ISBN {clean_isbn} already exists in the library.")
-            return False
+            return None
 
-        book_data = self.fetch_book_from_api(clean_isbn)   
-        # If the book is not found or API request fails, print the message and return False
+        book_data = await self.fetch_book_from_api(clean_isbn)
+        # If the book is not found or API request fails, print the message and return None
         if book_data is None:
             print(f"Book with ISBN {clean_isbn} not found or could not be retrieved.")
-            return False
+            return None
+
+        # Another request may have added the same book while this one waited for Open Library
+        if clean_isbn in self._index:
+            print(f"Book with ISBN {clean_isbn} already exists in the library.")
+            return None
         
         # Create book object 
         try:
@@ -171,94 +417,364 @@ class Library:
                     book_data['publication_year']
                 )
             
-            self._books.append(book)
-            self.save_books()
+            self.add_book(book)
             print(f"Book added successfully: {book}")
-            return True
+            return book
             
         except Exception as e:
             print(f"Error creating book object: {e}")
-            return False
+            return None
+
+    async def add_books_by_isbn(self, isbns: list):
+        # Add several books by ISBN at once and return the status of each ISBN
+        # Open Library lookups run concurrently and the changes are saved with a single write
+        self._ensure_loaded()
+        results = []
+        new_isbns = []
+        for isbn in isbns:
+            clean_isbn = normalize_isbn(isbn)
+            if not is_valid_isbn(clean_isbn):
+                results.append({"isbn": clean_isbn, "status": "invalid"})
+            # Repeated ISBNs in the same batch count as existing books
+            elif clean_isbn in self._index or clean_isbn in new_isbns:
+                results.append({"isbn": clean_isbn, "status": "exists"})
+            else:
+                # Status is filled in after the lookup
+                results.append({"isbn": clean_isbn, "status": None})
+                new_isbns.append(clean_isbn)
+
+        semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+        async def fetch(isbn):
+            async with semaphore:
+                return await self.fetch_book_from_api(isbn)
+
+        fetched = await asyncio.gather(*(fetch(isbn) for isbn in new_isbns))
+        books = []
+        statuses = {}
+        for clean_isbn, book_data in zip(new_isbns, fetched):
+            if book_data is None:
+                statuses[clean_isbn] = "not_found"
+            # Another request may have added the book while this one waited for Open Library
+            elif clean_isbn in self._index:
+                statuses[clean_isbn] = "exists"
+            else:
+                books.append(Book(
+                    book_data['title'],
+                    book_data['author'],
+                    book_data['isbn'],
+                    book_data['publication_year']
+                ))
+                statuses[clean_isbn] = "added"
+        self.add_books(books)
+
+        for result in results:
+            if result["status"] is None:
+                result["status"] = statuses[result["isbn"]]
+        return results
 
     def add_book(self, book: Book):
         # Old method from step 1
-        self._books.append(book)
-        self.save_books()
+        self.add_books([book])
+
+    def add_books(self, books: list):
+        # Add several books with a single journal write
+        self._ensure_loaded()
+        if not books:
+            return
+        for book in books:
+            self._index_add(book)
+        self._books_cache = None
+        self._append_log(*({"op": "add", **book.to_dict()} for book in books))
 
     def remove_book(self, isbn: str):
         # Remove a book by ISBN
-        clean_isbn = normalize_isbn(isbn)
-        self._books = [book for book in self._books if normalize_isbn(book.isbn) != clean_isbn]
-        self.save_books()
+        self._ensure_loaded()
+        book = self._index.get(normalize_isbn(isbn))
+        if book:
+            self._index_remove(book)
+            self._books_cache = None
+            self._append_log({"op": "del", "isbn": book.isbn})
     
     def find_book(self, isbn: str):
-        # Find a book by ISBN
-        clean_isbn = normalize_isbn(isbn)
-        for book in self._books:
-            if normalize_isbn(book.isbn) == clean_isbn:
-                return book
-        # If no match is found, return None
-        return None
+        # Find a book by ISBN, returns None if no match is found
+        self._ensure_loaded()
+        return self._index.get(normalize_isbn(isbn))
     
     def show_books(self):
         # List books if exist
-        if not self._books:
+        self._ensure_loaded()
+        if not self._index:
             print("No books in the library.")
             return
-        for book in self._books:
-            print(book)
+        # Build the whole listing and print it once instead of calling print() for every book
+        print("\n".join(map(str, self._index.values())))
 
     def list_author_books(self, author: str):
-        # List books by author name
-        matches = [book for book in self._books if book.author.lower() == author.lower()]
-        return matches
+        # List books by author name, a copy so callers cannot change the index
+        self._ensure_loaded()
+        return list(self._by_author.get(author.lower().strip(), {}).values())
+
+    def list_books_by_type(self, book_type: str):
+        # List books of a kind, a copy so callers cannot change the index
+        self._ensure_loaded()
+        return list(self._by_type.get(book_type.lower().strip(), {}).values())
 
     def show_books_by_type(self, book_type: str):
-        # List books of a kind
-        found_books = False
-        for book in self._books:
-            if book.book_type.lower() == book_type.lower():
-                print(book)
-                found_books = True
-        if not found_books:
+        # Print books of a kind
+        self._ensure_loaded()
+        books = self._by_type.get(book_type.lower().strip())
+        if not books:
             print(f"No books of type '{book_type}' found in the library.")
+            return
+        print("\n".join(map(str, books.values())))
         
     def load_books(self):
+        # Load the books from the SQLite database or from the JSON file and its journal
+        self._books_cache = None
+        self._index = {}
+        self._log_ops = 0
+        torn_journal = False
+        if self.lib_name is None:
+            # An in-memory library starts empty
+            pass
+        elif self.lib_name.endswith(SQLITE_SUFFIXES):
+            if self._db is None:
+                self._db = open_book_db(self.lib_name)
+            # rowid keeps the order in which the books were added
+            for row in self._db.execute("SELECT * FROM books ORDER BY rowid"):
+                book = book_from_dict(dict(row))
+                self._index[book.isbn] = book
+        else:
+            torn_journal = self._load_json()
+
+        books = list(self._index.values())
+        self._index = {}
+        self._by_author = {}
+        self._by_type = {}
+        for book in books:
+            self._index_add(book)
+        # Only set once loading succeeded, so after an error the next access loads again instead
+        # of working on (and later saving) a partial library
+        self._loaded = True
+        if torn_journal:
+            # The next change would be appended to the partly written line and be lost with it on
+            # the following load, so the journal is compacted into the JSON file first
+            self.save_books()
+
+    def _load_json(self):
+        # Load the last saved JSON file, then replay the changes recorded in the journal
+        # Returns True if the journal ends with a partly written line
+        torn = False
         try:
             # Open the JSON file
-            with open(self.lib_name, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self._books = []
-                for item in data:
-                    # Check book type and create the according object
-                    if item.get("book_type") == "EBook":
-                        self._books.append(EBook(
-                            item["title"], item["author"], item["isbn"],
-                            item["publication_year"], item["file_format"]
-                        ))
-                    elif item.get("book_type") == "AudioBook":
-                        self._books.append(AudioBook(
-                            item["title"], item["author"], item["isbn"],
-                            item["publication_year"], item["duration_min"]
-                        ))
-                    else:
-                        self._books.append(Book(
-                            item["title"], item["author"], item["isbn"], item["publication_year"]
-                        ))
+            with open(self.lib_name, 'rb') as f:
+                for item in json_loads(f.read()):
+                    book = book_from_dict(item)
+                    self._index[book.isbn] = book
+        except FileNotFoundError:
+            # If file does not exist, start with an empty library
+            pass
 
+        try:
+            with open(self._log_name, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json_loads(line)
+                    except json.JSONDecodeError:
+                        # A partially written last line (e.g. after a crash) is ignored
+                        torn = True
+                        break
+                    # A complete record without its newline would be merged with the next one
+                    if not line.endswith(b"\n"):
+                        torn = True
+                    # Replaying is idempotent, so changes that are already saved are harmless
+                    if record["op"] == "add":
+                        book = book_from_dict(record)
+                        # A replaced book moves to the end, as in _index_add and SQLite's INSERT OR REPLACE
+                        self._index.pop(book.isbn, None)
+                        self._index[book.isbn] = book
+                    else:
+                        self._index.pop(record["isbn"], None)
+                    self._log_ops += 1
         except FileNotFoundError:
-            # If file does not exist, initialize empty list
-            self._books = [] # 
+            # No changes since the last save
+            pass
+        return torn
+
+    def _index_add(self, book: Book):
+        # Register a book in the lookup indexes, replacing any book with the same ISBN
+        old = self._index.get(book.isbn)
+        if old is not None:
+            self._index_remove(old)
+        self._index[book.isbn] = book
+        for key in author_keys(book.author):
+            self._by_author.setdefault(key, {})[book.isbn] = book
+        self._by_type.setdefault(book.book_type.lower(), {})[book.isbn] = book
+
+    def _index_remove(self, book: Book):
+        # Remove a book from the lookup indexes
+        del self._index[book.isbn]
+        for key in author_keys(book.author):
+            books = self._by_author[key]
+            del books[book.isbn]
+            if not books:
+                del self._by_author[key]
+        books = self._by_type[book.book_type.lower()]
+        del books[book.isbn]
+        if not books:
+            del self._by_type[book.book_type.lower()]
+
+    @contextmanager
+    def batch(self):
+        # Group the changes made inside the block into a single write, e.g. for bulk imports:
+        #     with library.batch():
+        #         for book in books: library.add_book(book)
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            # Changes are already in memory, so they are written even if the block raised
+            if self._batch_depth == 0 and self._batch_records:
+                records, self._batch_records = self._batch_records, []
+                self._write_log(records)
+
+    def _append_log(self, *records: dict):
+        # Record changes, held back while a batch() block is open
+        if self._batch_depth:
+            self._batch_records.extend(records)
+        else:
+            self._write_log(records)
+
+    def _write_log(self, records):
+        # Append changes to the journal instead of rewriting the whole JSON file
+        if self.lib_name is None:
+            # An in-memory library is never written to disk
+            return
+        if self._db is not None:
+            # In SQLite each change is a single row insert or delete, so nothing needs compacting;
+            # the records are queued as a tuple, which the writer thread applies to the database
+            self._submit_write(tuple(records))
+            return
+        self._submit_write(b"".join(json_dumps(record) + b"\n" for record in records))
+        self._log_ops += len(records)
+        # Compact the journal into the JSON file once it outgrows the library
+        if self._log_ops > 2 * len(self._index):
+            self.save_books()
 
     def save_books(self):
-        # Save all books to the JSON file
-        with open(self.lib_name, 'w', encoding='utf-8') as f:
-            # Transform book objects to dictionaries
-            json.dump([book.__dict__ for book in self._books], f, indent=4, ensure_ascii=False)
+        # Save all books to the JSON file and clear the journal
+        self._ensure_loaded()
+        if self.lib_name is None:
+            return
+        # A copy of the list is queued, so later changes do not leak into this save
+        self._submit_write(self.books)
+        self._log_ops = 0
+
+    def flush(self):
+        # Wait until every queued change has been written to disk
+        self._write_q.join()
+
+    def close(self):
+        # Write pending changes and close the SQLite connection (e.g. when the API server shuts down)
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            # Using the library again loads it again, which reopens the database
+            self._loaded = False
+
+    def _submit_write(self, item):
+        # Queue a journal line (bytes), SQLite changes (tuple of records) or a full save (list of books)
+        # for the writer thread, so callers such as the API endpoints do not wait for disk I/O
+        with self._writer_lock:
+            self._write_q.put(item)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+                self._writer.start()
+                # The writer is a daemon thread, so pending writes are flushed before exit
+                _libraries_to_flush.add(self)
+
+    def _writer_loop(self):
+        while True:
+            items = [self._write_q.get()]
+            # Coalesce everything that is already pending into as few writes as possible
+            while True:
+                try:
+                    items.append(self._write_q.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                if self._db is not None:
+                    self._db_apply(items)
+                else:
+                    self._file_apply(items)
+            except Exception as e:
+                # Any error is caught (e.g. orjson raises TypeError for integers over 64 bits), so the
+                # writer keeps running and flush() does not wait forever
+                print(f"Error saving library: {e}")
+            finally:
+                for _ in items:
+                    self._write_q.task_done()
+
+            # Stop when there is nothing left to write, so an idle library does not keep a thread
+            with self._writer_lock:
+                if self._write_q.empty():
+                    self._writer = None
+                    return
+
+    def _file_apply(self, items: list):
+        # Write queued items to the JSON file and the journal
+        saves = [i for i, item in enumerate(items) if isinstance(item, list)]
+        lines = [item for item in items if not isinstance(item, list)]
+        try:
+            if saves:
+                self._do_save(items[saves[-1]])
+                # A full save already contains every change queued before it
+                lines = items[saves[-1] + 1:]
+        except Exception as e:
+            # The changes are still appended to the journal, so a failed save loses nothing
+            print(f"Error saving library: {e}")
+
+        if lines:
+            with open(self._log_name, 'ab') as f:
+                f.write(b"".join(lines))
+
+    def _db_apply(self, items: list):
+        # Apply queued items to the SQLite database in one transaction
+        with self._db:
+            for item in items:
+                if isinstance(item, list):
+                    # A full save replaces the rows with the books that were in memory
+                    self._db.execute("DELETE FROM books")
+                    self._db.executemany(_INSERT_BOOK, [book_row(book.to_dict()) for book in item])
+                    continue
+                for record in item:
+                    if record["op"] == "add":
+                        self._db.execute(_INSERT_BOOK, book_row(record))
+                    else:
+                        self._db.execute("DELETE FROM books WHERE isbn = ?", (record["isbn"],))
+
+    def _do_save(self, books: list):
+        # The file is written to a temporary file and renamed, so a crash never leaves it half-written
+        tmp_name = f"{self.lib_name}.tmp"
+        # The JSON is encoded straight to UTF-8 bytes, so the file is written in binary mode
+        with open(tmp_name, 'wb') as f:
+            # Transform book objects to dictionaries, compact JSON since the file is only read by load_books
+            f.write(json_dumps([book.to_dict() for book in books]))
+        os.replace(tmp_name, self.lib_name)
+
+        # Every change in the journal is now part of the JSON file
+        try:
+            os.remove(self._log_name)
+        except FileNotFoundError:
+            pass
 
 
 # Main menu 
-def main():
+async def main():
     # Create Library object
     library = Library("library.json")
 
@@ -276,16 +792,16 @@ def main():
             # Add books according to their types 
             if type_choice == "2":  # EBook
                 file_format = input("File format (e.g., PDF, EPUB): ")
-                library.add_book_by_isbn(isbn, "ebook", file_format=file_format)
+                await library.add_book_by_isbn(isbn, "ebook", file_format=file_format)
             elif type_choice == "3":  # AudioBook
                 try:
                     duration_min = int(input("Duration (minutes): "))
-                    library.add_book_by_isbn(isbn, "audiobook", duration_min=duration_min)
+                    await library.add_book_by_isbn(isbn, "audiobook", duration_min=duration_min)
                 except ValueError:
                     print("Invalid duration.")
-                    library.add_book_by_isbn(isbn, "audiobook", duration_min=0)
+                    await library.add_book_by_isbn(isbn, "audiobook", duration_min=0)
             else:  # Normal Book
-                library.add_book_by_isbn(isbn)
+                await library.add_book_by_isbn(isbn)
 
         elif choice == "2":
             isbn = input("ISBN of the book being deleted: ")
@@ -326,5 +842,7 @@ def main():
         else:
             print("Invalid choice. Try again.")
 
+    await close_http_client()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -1,6 +1,13 @@
+import asyncio
+import httpx
+import importlib
 import pytest
+import sys
+import threading
+import time
 from pydantic import ValidationError
 from library import *
+import library
 from fastapi.testclient import TestClient
 import api
 
@@ -16,6 +23,11 @@ def test_initialization():
     assert book.isbn == "9781444720723"
     assert book.publication_year == 2011
 
+def test_initialization_normalizes_isbn():
+    # Test that Book stores the ISBN without hyphens and spaces
+    book = Book("Shining", "Stephen King", "978-1444 720723", 2011)
+    assert book.isbn == "9781444720723"
+
 def test_ebook_initialization():
     # Test that EBook object is initialized with its correct attributes
     ebook = EBook("Dune", "Frank Herbert", "9780441172719", 1965, "EPUB")
@@ -36,6 +48,37 @@ def test_audiobook_initialization():
     assert audiobook.duration_min == 930
     assert audiobook.book_type == "AudioBook"
 
+def test_to_dict():
+    # Test that to_dict() includes the attributes of each book type
+    audiobook = AudioBook("Project Hail Mary", "Andy Weir", "9780593135211", 2021, 930)
+    assert audiobook.to_dict() == {
+        "title": "Project Hail Mary",
+        "author": "Andy Weir",
+        "isbn": "9780593135211",
+        "publication_year": 2021,
+        "book_type": "AudioBook",
+        "duration_min": 930
+    }
+    assert EBook("Dune", "Frank Herbert", "9780441172719", 1965, "EPUB").to_dict()["file_format"] == "EPUB"
+
+def test_book_from_dict():
+    # Test that book_from_dict() creates the class of the saved book type and round-trips to_dict()
+    for book in (Book("A", "B", "9780316769488", 2000),
+                 EBook("A", "B", "9780316769488", 2000, "PDF"),
+                 AudioBook("A", "B", "9780316769488", 2000, 60)):
+        loaded = book_from_dict(book.to_dict())
+        assert type(loaded) is type(book)
+        assert loaded.to_dict() == book.to_dict()
+    assert type(book_from_dict({"title": "A", "author": "B", "isbn": "9780316769488",
+                                "publication_year": 2000, "book_type": "Magazine"})) is Book
+
+def test_books_have_no_instance_dict():
+    # Test that books use __slots__ instead of a per-instance __dict__
+    for book in (Book("A", "B", "9780316769488", 2000),
+                 EBook("A", "B", "9780316769488", 2000, "PDF"),
+                 AudioBook("A", "B", "9780316769488", 2000, 60)):
+        assert not hasattr(book, "__dict__")
+
 # -------------------
 # Pydantic validation tests
 # -------------------
@@ -61,6 +104,47 @@ def test_bookmodel_invalid_publication_year():
     with pytest.raises(ValidationError):
         BookModel(title="Example", author="Author", isbn="9780000000000", publication_year=1300)
 
+# -------------------
+# ISBN validation tests
+# -------------------
+
+def test_is_valid_isbn():
+    # Test that is_valid_isbn() accepts ISBNs with a correct check digit
+    assert is_valid_isbn("9780316769488")
+    assert is_valid_isbn("0306406152")
+    assert is_valid_isbn("080442957X")
+
+def test_is_valid_isbn_invalid():
+    # Test that is_valid_isbn() rejects wrong check digits, lengths and characters
+    assert not is_valid_isbn("9780316769489")
+    assert not is_valid_isbn("1234567890")
+    assert not is_valid_isbn("978031676948")
+    assert not is_valid_isbn("97803167694X8")
+    assert not is_valid_isbn("X306406152")
+
+def test_normalize_isbn_uppercases_check_digit():
+    # Test that a lowercase 'x' check digit is stored as 'X', so both spellings are the same book
+    assert normalize_isbn("0-8044-2957-x") == "080442957X"
+    lib = Library(lib_name=None)
+    lib.add_book(Book("Lower", "Author", "080442957x", 1985))
+    assert lib.find_book("080442957X").title == "Lower"
+    lib.add_book(Book("Upper", "Author", "080442957X", 1985))
+    assert len(lib.books) == 1
+
+def test_add_book_by_isbn_invalid_check_digit(monkeypatch, tmp_path):
+    # Test that add_book_by_isbn() rejects an invalid check digit without calling the API
+    lib = Library(lib_name=str(tmp_path / "library.json"))
+    async def mock_get_book(isbn):
+        raise AssertionError("API should not be called")
+    monkeypatch.setattr(lib, "fetch_book_from_api", mock_get_book)
+    assert asyncio.run(lib.add_book_by_isbn("9780316769489")) is None
+
+def test_bookrequest_invalid_characters():
+    # Test that BookRequest raises ValidationError when ISBN contains invalid characters
+    with pytest.raises(ValidationError):
+        BookRequest(isbn="97803167694a8")
+    assert BookRequest(isbn="080442957X").isbn == "080442957X"
+
 # -------------------
 # Library method tests
 # -------------------
@@ -69,12 +153,13 @@ def test_bookmodel_invalid_publication_year():
 @pytest.fixture
 def sample_library():
     # Create sample library and add sample books
-    lib = Library(lib_name="SampleLibrary")
-    lib._books = [
+    lib = Library(lib_name=None)
+    for book in [
         Book(title="Great Book", author="Author A", isbn="1111111111111", publication_year=2020),
         EBook(title="Long Ebook", author="Author B", isbn="2222222222222", publication_year=2021, file_format="pdf"),
         AudioBook(title="Fantastic AudioBook", author="Author A", isbn="3333333333333", publication_year=2019, duration_min=90),
-    ]
+    ]:
+        lib.add_book(book)
     return lib
 
 def test_show_books(capsys, sample_library):
@@ -93,6 +178,44 @@ def test_list_author_books(sample_library):
     assert "Fantastic AudioBook" in titles
     assert "Long Ebook" not in titles
 
+def test_list_author_books_co_authors(sample_library):
+    # Test that list_author_books() finds books of each author in a comma-separated author list
+    sample_library.add_book(Book("Joint Book", "Author B, Author C", "4444444444444", 2022))
+    assert [book.title for book in sample_library.list_author_books("author c")] == ["Joint Book"]
+    assert [book.title for book in sample_library.list_author_books("Author B, Author C")] == ["Joint Book"]
+    assert len(sample_library.list_author_books("Author B")) == 2
+
+def test_list_author_books_after_remove(sample_library):
+    # Test that list_author_books() does not return removed books
+    sample_library.remove_book("1111111111111")
+    assert [book.title for book in sample_library.list_author_books("Author A")] == ["Fantastic AudioBook"]
+    sample_library.remove_book("2222222222222")
+    assert sample_library.list_author_books("Author B") == []
+
+def test_add_book_same_isbn_replaces_book(sample_library):
+    # Test that adding a book with an existing ISBN replaces it in every index
+    sample_library.add_book(Book("New Edition", "Author C", "1111111111111", 2024))
+    assert sample_library.find_book("1111111111111").title == "New Edition"
+    assert [book.title for book in sample_library.list_author_books("Author A")] == ["Fantastic AudioBook"]
+    assert len(sample_library.list_books_by_type("book")) == 1
+    sample_library.remove_book("1111111111111")
+    assert sample_library.list_author_books("Author C") == []
+    assert sample_library.list_books_by_type("book") == []
+
+@pytest.mark.parametrize("lib_name", ["library.json", "library.db"])
+def test_replaced_book_order_survives_reload(tmp_path, lib_name):
+    # Test that a replaced book is listed in the same position after the library is reloaded
+    test_file = str(tmp_path / lib_name)
+    lib = Library(lib_name=test_file)
+    lib.add_book(Book("A", "Author", "9780316769488", 1951))
+    lib.add_book(Book("B", "Author", "0306406152", 1968))
+    lib.add_book(Book("A2", "Author", "9780316769488", 1951))
+    assert [book.title for book in lib.books] == ["B", "A2"]
+    lib.flush()
+    reloaded = Library(lib_name=test_file)
+    assert [book.title for book in reloaded.books] == ["B", "A2"]
+    assert [book.title for book in reloaded.list_author_books("Author")] == ["B", "A2"]
+
 def test_show_books_by_type(capsys, sample_library):
     # Test that show_books_by_type() shows books from specified type
     sample_library.show_books_by_type("ebook")
@@ -101,6 +224,294 @@ def test_show_books_by_type(capsys, sample_library):
     assert "Great Book" not in captured.out
     assert "Fantastic AudioBook" not in captured.out
 
+def test_list_books_by_type(sample_library):
+    # Test that list_books_by_type() follows added and removed books
+    sample_library.add_book(EBook("Second Ebook", "Author C", "4444444444444", 2022, "EPUB"))
+    assert [book.title for book in sample_library.list_books_by_type("EBOOK")] == ["Long Ebook", "Second Ebook"]
+    sample_library.remove_book("2222222222222")
+    assert [book.title for book in sample_library.list_books_by_type("ebook")] == ["Second Ebook"]
+    assert [book.title for book in sample_library.list_books_by_type("book")] == ["Great Book"]
+
+def test_show_books_by_type_unknown(capsys, sample_library):
+    # Test that show_books_by_type() reports when no book has the given type
+    sample_library.show_books_by_type("magazine")
+    captured = capsys.readouterr()
+    assert "No books of type 'magazine' found" in captured.out
+
+def test_find_book_normalizes_isbn(tmp_path):
+    # Test that find_book() matches a stored book regardless of hyphens and spaces
+    lib = Library(lib_name=str(tmp_path / "library.json"))
+    book = Book("Indexed", "Author", "978-0-316-76948-8", 1951)
+    lib.add_book(book)
+    assert lib.find_book("9780316769488") is book
+    assert lib.find_book("978 0316 769488") is book
+
+def test_remove_book(tmp_path):
+    # Test that remove_book() removes the book from the library and its index
+    lib = Library(lib_name=str(tmp_path / "library.json"))
+    lib.add_book(Book("Remove Me", "Author", "9780316769488", 1951))
+    lib.remove_book("978-0316769488")
+    assert lib.find_book("9780316769488") is None
+    assert lib.books == []
+
+def test_remove_book_keeps_order(sample_library):
+    # Test that removing a book keeps the other books in the order they were added
+    sample_library.remove_book("2222222222222")
+    assert [book.title for book in sample_library.books] == ["Great Book", "Fantastic AudioBook"]
+
+def test_load_books_builds_index(tmp_path):
+    # Test that books saved to the JSON file can be found after reloading the library
+    test_file = tmp_path / "library.json"
+    saved = Library(lib_name=str(test_file))
+    saved.add_book(Book("Saved", "Author", "9780316769488", 1951))
+    saved.flush()
+    lib = Library(lib_name=str(test_file))
+    assert lib.find_book("9780316769488").title == "Saved"
+
+def test_save_and_load_books(tmp_path):
+    # Test that every book type keeps its attributes after saving and reloading
+    test_file = tmp_path / "library.json"
+    lib = Library(lib_name=str(test_file))
+    lib.add_book(EBook("Dune", "Frank Herbert", "9780441172719", 1965, "EPUB"))
+    lib.add_book(AudioBook("Rómulo", "Rómulo Macció", "9780593135211", 2021, 930))
+    lib.flush()
+    reloaded = Library(lib_name=str(test_file))
+    ebook = reloaded.find_book("9780441172719")
+    audiobook = reloaded.find_book("9780593135211")
+    assert isinstance(ebook, EBook) and ebook.file_format == "EPUB"
+    assert isinstance(audiobook, AudioBook) and audiobook.duration_min == 930
+    assert audiobook.author == "Rómulo Macció"
+
+def test_changes_are_appended_to_journal(tmp_path):
+    # Test that add_book() appends to the journal and the change survives a reload
+    test_file = tmp_path / "library.json"
+    lib = Library(lib_name=str(test_file))
+    lib.add_book(Book("First", "Author", "9780316769488", 1951))
+    lib.add_book(Book("Second", "Author", "9780441172719", 1965))
+    lib.flush()
+    assert len((tmp_path / "library.json.log").read_bytes().splitlines()) == 2
+    reloaded = Library(lib_name=str(test_file))
+    assert [book.title for book in reloaded.books] == ["First", "Second"]
+
+def test_journal_is_compacted(tmp_path):
+    # Test that the journal is merged into the JSON file once it outgrows the library
+    test_file = tmp_path / "library.json"
+    lib = Library(lib_name=str(test_file))
+    lib.add_book(Book("Kept", "Author", "9780316769488", 1951))
+    lib.add_book(Book("Removed", "Author", "9780441172719", 1965))
+    lib.remove_book("9780441172719")
+    lib.flush()
+    assert not (tmp_path / "library.json.log").exists()
+    reloaded = Library(lib_name=str(test_file))
+    assert [book.title for book in reloaded.books] == ["Kept"]
+
+def test_writes_are_coalesced(tmp_path):
+    # Test that pending journal lines and saves end up on disk in order after flush()
+    test_file = tmp_path / "library.json"
+    lib = Library(lib_name=str(test_file))
+    for i in range(20):
+        lib.add_book(Book(f"Book {i}", "Author", f"97800000000{i:02d}", 2000))
+    lib.save_books()
+    lib.remove_book("9780000000000")
+    lib.flush()
+    reloaded = Library(lib_name=str(test_file))
+    assert len(reloaded.books) == 19
+    assert reloaded.find_book("9780000000000") is None
+
+def test_save_and_load_books_without_orjson(monkeypatch, tmp_path):
+    # Test that the library falls back to the standard json module when orjson is not installed
+    monkeypatch.setattr(library, "orjson", None)
+    test_file = tmp_path / "library.json"
+    lib = Library(lib_name=str(test_file))
+    lib.add_book(AudioBook("Rómulo", "Rómulo Macció", "9780593135211", 2021, 930))
+    lib.save_books()
+    lib.add_book(Book("Journal", "Author", "9780316769488", 1951))
+    lib.flush()
+    assert "Rómulo Macció" in test_file.read_text(encoding="utf-8")
+    reloaded = Library(lib_name=str(test_file))
+    assert [book.title for book in reloaded.books] == ["Rómulo", "Journal"]
+
+def test_sqlite_library(tmp_path):
+    # Test that a library with a .db name is stored in SQLite and keeps the order of the books
+    test_file = tmp_path / "library.db"
+    lib = Library(lib_name=str(test_file))
+    lib.add_book(EBook("Dune", "Frank Herbert", "9780441172719", 1965, "EPUB"))
+    lib.add_book(AudioBook("Project Hail Mary", "Andy Weir", "9780593135211", 2021, 930))
+    lib.add_book(Book("Removed", "Author", "9780316769488", 1951))
+    lib.remove_book("9780316769488")
+    lib.flush()
+    assert not (tmp_path / "library.db.log").exists()
+
+    reloaded = Library(lib_name=str(test_file))
+    assert [book.title for book in reloaded.books] == ["Dune", "Project Hail Mary"]
+    assert reloaded.find_book("9780441172719").file_format == "EPUB"
+    assert reloaded.find_book("9780593135211").duration_min == 930
+    assert reloaded.list_author_books("Andy Weir")[0].book_type == "AudioBook"
+
+def test_sqlite_save_books(tmp_path):
+    # Test that save_books() rewrites the database rows from the books in memory
+    test_file = tmp_path / "library.sqlite"
+    lib = Library(lib_name=str(test_file))
+    lib.add_book(Book("First", "Author", "9780316769488", 1951))
+    lib.add_book(Book("Second", "Author", "9780441172719", 1965))
+    lib.save_books()
+    lib.close()
+    assert [book.title for book in Library(lib_name=str(test_file)).books] == ["First", "Second"]
+
+def test_sqlite_library_reopens_after_close(tmp_path):
+    # Test that close() writes pending changes and a closed library reopens its database when used
+    test_file = str(tmp_path / "library.db")
+    lib = Library(lib_name=test_file)
+    lib.add_book(Book("First", "Author", "9780316769488", 1951))
+    lib.close()
+    assert lib._db is None
+    lib.add_book(Book("Second", "Author", "9780441172719", 1965))
+    lib.close()
+    assert [book.title for book in Library(lib_name=test_file).books] == ["First", "Second"]
+
+def test_batch_writes_once(monkeypatch, tmp_path):
+    # Test that changes inside batch() are written together when the outermost block ends
+    test_file = tmp_path / "library.json"
+    lib = Library(lib_name=str(test_file))
+    # Count the journal writes while still writing them
+    writes = []
+    write_log = lib._write_log
+    def counting_write_log(records):
+        writes.append(len(records))
+        write_log(records)
+    monkeypatch.setattr(lib, "_write_log", counting_write_log)
+    with lib.batch():
+        lib.add_book(Book("First", "Author", "9780316769488", 1951))
+        with lib.batch():
+            lib.add_book(Book("Second", "Author", "9780441172719", 1965))
+        lib.remove_book("9780316769488")
+        assert writes == []
+    assert writes == [3]
+    lib.flush()
+    reloaded = Library(lib_name=str(test_file))
+    assert [book.title for book in reloaded.books] == ["Second"]
+
+def test_journal_ignores_partial_line(tmp_path):
+    # Test that a partially written last journal line does not break loading
+    test_file = tmp_path / "library.json"
+    lib = Library(lib_name=str(test_file))
+    lib.add_book(Book("Saved", "Author", "9780316769488", 1951))
+    lib.flush()
+    with open(tmp_path / "library.json.log", "ab") as f:
+        f.write(b'{"op": "add", "title": "Tor')
+    reloaded = Library(lib_name=str(test_file))
+    assert [book.title for book in reloaded.books] == ["Saved"]
+
+    # Changes made after the crash are not lost with the partly written line
+    reloaded.add_book(Book("After Crash", "Author", "0306406152", 1968))
+    reloaded.flush()
+    assert [book.title for book in Library(lib_name=str(test_file)).books] == ["Saved", "After Crash"]
+
+def test_failed_save_keeps_journal_changes(tmp_path):
+    # Test that journal lines coalesced with a failed save are still written to the journal
+    test_file = tmp_path / "library.json"
+    lib = Library(lib_name=str(test_file))
+    book = Book("Kept", "Author", "9780316769488", 1951)
+
+    def failing_save(books):
+        raise OSError("disk full")
+
+    lib._do_save = failing_save
+    lib._write_q.put(json_dumps({"op": "add", **book.to_dict()}) + b"\n")
+    lib._write_q.put([book])
+    lib._writer_loop()
+
+    reloaded = Library(lib_name=str(test_file))
+    assert reloaded.find_book("9780316769488").title == "Kept"
+
+def test_flush_returns_after_unexpected_save_error(tmp_path):
+    # Test that a save failing with something other than OSError does not stop the writer thread
+    test_file = tmp_path / "library.json"
+    lib = Library(lib_name=str(test_file))
+
+    def failing_save(books):
+        raise TypeError("Integer exceeds 64-bit range")
+
+    lib._do_save = failing_save
+    lib.add_book(Book("Kept", "Author", "9780316769488", 1951))
+    lib.save_books()
+    flusher = threading.Thread(target=lib.flush, daemon=True)
+    flusher.start()
+    flusher.join(timeout=5)
+    assert not flusher.is_alive()
+    assert Library(lib_name=str(test_file)).find_book("9780316769488").title == "Kept"
+
+def test_writer_thread_stops_when_idle(tmp_path):
+    # Test that the writer thread exits once every queued write is done
+    lib = Library(lib_name=str(tmp_path / "library.json"))
+    lib.add_book(Book("Book", "Author", "9780316769488", 1951))
+    lib.flush()
+    # The thread marks itself stopped just after the last write is done
+    for _ in range(500):
+        if lib._writer is None:
+            break
+        time.sleep(0.01)
+    assert lib._writer is None
+
+def test_in_memory_library_writes_nothing(tmp_path, monkeypatch):
+    # Test that a library without a file name never touches the disk
+    monkeypatch.chdir(tmp_path)
+    lib = Library(lib_name=None)
+    lib.add_book(Book("Memory", "Author", "9780316769488", 1951))
+    lib.save_books()
+    lib.flush()
+    assert lib.find_book("9780316769488").title == "Memory"
+    assert list(tmp_path.iterdir()) == []
+    assert lib._log_name is None
+
+def test_library_requires_lib_name():
+    # Test that the in-memory mode has to be chosen explicitly
+    with pytest.raises(TypeError):
+        Library()
+
+def test_loaded_strings_are_shared():
+    # Test that repeated author names and file formats are a single string after loading
+    first = book_from_dict({"book_type": "EBook", "title": "A", "author": "".join(["Same ", "Author"]),
+                            "isbn": "9780316769488", "publication_year": 1951, "file_format": "".join(["ep", "ub"])})
+    second = book_from_dict({"book_type": "EBook", "title": "B", "author": "".join(["Same ", "Author"]),
+                             "isbn": "0306406152", "publication_year": 1968, "file_format": "".join(["ep", "ub"])})
+    assert first.author is second.author
+    assert first.file_format is second.file_format
+
+def test_ebook_without_file_format_round_trip(tmp_path):
+    # Test that an ebook added without a file format is saved as null and loads again
+    test_file = tmp_path / "library.json"
+    lib = Library(lib_name=str(test_file))
+    lib.add_book(EBook("No Format", "Author", "9780316769488", 1951, None))
+    lib.flush()
+    assert Library(lib_name=str(test_file)).find_book("9780316769488").file_format is None
+    lib.save_books()
+    lib.flush()
+    assert Library(lib_name=str(test_file)).find_book("9780316769488").file_format is None
+
+def test_failed_load_is_retried(tmp_path):
+    # Test that a library whose load raised does not work on, or save, the books loaded so far
+    test_file = tmp_path / "library.json"
+    content = ('[{"title": "One", "author": "Author", "isbn": "9780316769488", "publication_year": 1951},'
+               ' {"title": "Two", "author": "Author", "isbn": "0306406152", "publication_year": 1968},'
+               ' {"title": "Broken", "isbn": "9780441172719"}]')
+    test_file.write_text(content)
+    lib = Library(lib_name=str(test_file))
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            lib.find_book("9780316769488")
+    with pytest.raises(KeyError):
+        lib.remove_book("9780316769488")
+    lib.flush()
+    assert test_file.read_text() == content
+
+def test_books_are_loaded_on_first_use(tmp_path):
+    # Test that creating a library does not read its file until books are needed
+    test_file = tmp_path / "library.json"
+    lib = Library(lib_name=str(test_file))
+    test_file.write_text('[{"title": "Late", "author": "Author", "isbn": "9780316769488", "publication_year": 1951}]')
+    assert lib.find_book("9780316769488").title == "Late"
+
 # -------------------
 # API integration tests
 # -------------------
@@ -108,7 +519,7 @@ def test_show_books_by_type(capsys, sample_library):
 def test_fetch_book_from_api(monkeypatch):
     # Test that the mocked fetch_book_from_api() returns expected data structure
     # Mock function does not make real API calls, it simulates API response
-    def mock_get_book(isbn):
+    async def mock_get_book(isbn):
         return {
             "title": "Mock Title",
             "author": "Mock Author",
@@ -120,7 +531,7 @@ def test_fetch_book_from_api(monkeypatch):
     # Replace fetch_book_from_api method with mock function
     monkeypatch.setattr(lib, "fetch_book_from_api", mock_get_book)
 
-    result = lib.fetch_book_from_api("1234567890")
+    result = asyncio.run(lib.fetch_book_from_api("1234567890"))
     assert result["title"] == "Mock Title"
     assert result["author"] == "Mock Author"
 
@@ -128,22 +539,54 @@ def test_fetch_book_from_api(monkeypatch):
 def test_fetch_book_from_api_not_found(monkeypatch):
     # Test that fetch_book_from_api() returns None when book is not found in API
     # Mock function simulates book not found
-    def mock_get_book(isbn):
+    async def mock_get_book(isbn):
         return None
     lib = Library(lib_name="test_library.json")
     monkeypatch.setattr(lib, "fetch_book_from_api", mock_get_book)
     # Test API call for non-existent book
-    result = lib.fetch_book_from_api("0000000000")
+    result = asyncio.run(lib.fetch_book_from_api("0000000000"))
     assert result is None
 
 
+def test_fetch_book_from_api_uses_cache(monkeypatch):
+    # Test that fetch_book_from_api() parses the Open Library response and caches it by ISBN
+    # MockTransport answers the shared client's requests without network access
+    requests = []
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"docs": [{
+            "title": "Dune",
+            "author_name": ["Frank Herbert"],
+            "first_publish_year": 1965
+        }]})
+    monkeypatch.setattr(library, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(library, "_fetch_cache", library.OrderedDict())
+    lib = Library(lib_name="test_library.json")
+
+    async def fetch_twice():
+        first = await lib.fetch_book_from_api("978-0441172719")
+        second = await lib.fetch_book_from_api("9780441172719")
+        await library.close_http_client()
+        return first, second
+
+    first, second = asyncio.run(fetch_twice())
+    assert first == second == {
+        "title": "Dune",
+        "author": "Frank Herbert",
+        "isbn": "9780441172719",
+        "publication_year": 1965
+    }
+    assert len(requests) == 1
+    assert requests[0].url.params["isbn"] == "9780441172719"
+
+
 def test_add_book_by_isbn(monkeypatch, tmp_path):
     # Test that add_book_by_isbn() adds a book when API returns valid data
     # Create temporary test file to avoid affecting real library
     test_file = tmp_path / "library.json"
     lib = Library(lib_name=str(test_file))
     # Mock function that simulates successful API response
-    def mock_get_book(isbn):
+    async def mock_get_book(isbn):
         return {
             "title": "Mock Title",
             "author": "Mock Author",
@@ -151,29 +594,29 @@ def test_add_book_by_isbn(monkeypatch, tmp_path):
             "publication_year": 2024
         }
     monkeypatch.setattr(lib, "fetch_book_from_api", mock_get_book)
-    added = lib.add_book_by_isbn("1234567890")
-    assert added is True
-    assert len(lib._books) == 1
-    assert lib._books[0].title == "Mock Title"
+    added = asyncio.run(lib.add_book_by_isbn("0306406152"))
+    assert added is lib.books[0]
+    assert len(lib.books) == 1
+    assert lib.books[0].title == "Mock Title"
 
 
 def test_add_book_by_isbn_invalid_isbn(tmp_path):
-    # Test that add_book_by_isbn() returns False when ISBN is invalid
+    # Test that add_book_by_isbn() returns None when ISBN is invalid
     test_file = tmp_path / "library.json"
     lib = Library(lib_name=str(test_file))
-    result = lib.add_book_by_isbn("invalid_isbn")
-    assert result is False
+    result = asyncio.run(lib.add_book_by_isbn("invalid_isbn"))
+    assert result is None
 
 
 def test_add_book_by_isbn_already_exists(monkeypatch, tmp_path):
-    # Test that add_book_by_isbn() returns False when the given book already exists
+    # Test that add_book_by_isbn() returns None when the given book already exists
     test_file = tmp_path / "library.json"
     lib = Library(lib_name=str(test_file))
 
     # Add a book to library first
-    lib._books.append(Book("Existing", "Author", "1234567890", 2023))
+    lib.add_book(Book("Existing", "Author", "0306406152", 2023))
 
-    def mock_get_book(isbn):
+    async def mock_get_book(isbn):
         return {
             "title": "Mock Title",
             "author": "Mock Author",
@@ -183,8 +626,31 @@ def test_add_book_by_isbn_already_exists(monkeypatch, tmp_path):
     monkeypatch.setattr(lib, "fetch_book_from_api", mock_get_book)
 
     # Test adding a book with the same ISBN
-    result = lib.add_book_by_isbn("1234567890")
-    assert result is False
+    result = asyncio.run(lib.add_book_by_isbn("0306406152"))
+    assert result is None
+
+
+def test_add_book_by_isbn_concurrent_same_isbn(monkeypatch):
+    # Test that concurrent adds of the same ISBN add the book only once
+    lib = Library(lib_name=None)
+
+    async def mock_get_book(isbn):
+        await asyncio.sleep(0.01)
+        return {
+            "title": "Mock Title",
+            "author": "Mock Author",
+            "isbn": isbn,
+            "publication_year": 2024
+        }
+    monkeypatch.setattr(lib, "fetch_book_from_api", mock_get_book)
+
+    async def add_twice():
+        return await asyncio.gather(lib.add_book_by_isbn("0306406152"), lib.add_book_by_isbn("0306406152"))
+
+    results = asyncio.run(add_twice())
+    assert sum(result is not None for result in results) == 1
+    assert len(lib.books) == 1
+    assert len(lib.list_author_books("Mock Author")) == 1
 
 # -------------------
 # API endpoint tests
@@ -221,12 +687,37 @@ def test_get_books_empty(test_client):
     assert response.json() == []
 
 
+def test_get_books(test_client):
+    # Test get(/books) returns the books with the BookResponse fields only
+    client, test_library = test_client
+    test_library.add_book(EBook("Dune", "Frank Herbert", "9780441172719", 1965, "EPUB"))
+    response = client.get("/books")
+    assert response.status_code == 200
+    assert response.json() == [{
+        "title": "Dune",
+        "author": "Frank Herbert",
+        "isbn": "9780441172719",
+        "publication_year": 1965,
+        "book_type": "EBook"
+    }]
+
+
+def test_get_books_after_change(test_client):
+    # Test get(/books) does not return a stale list after books are added or removed
+    client, test_library = test_client
+    assert client.get("/books").json() == []
+    test_library.add_book(Book("New Book", "Author", "9780316769488", 1951))
+    assert [book["title"] for book in client.get("/books").json()] == ["New Book"]
+    client.delete("/books/9780316769488")
+    assert client.get("/books").json() == []
+
+
 def test_add_book(test_client, monkeypatch):
     # Test post.(/books) successfully adds a new book
     client, test_library = test_client
 
     # Mock function does not make real API calls
-    def mock_fetch(isbn):
+    async def mock_fetch(isbn):
         return {
             "title": "Mock Title",
             "author": "Mock Author",
@@ -237,18 +728,99 @@ def test_add_book(test_client, monkeypatch):
     # Replace fetch_book_from_api method with mock function
     monkeypatch.setattr(test_library, "fetch_book_from_api", mock_fetch)
 
-    response = client.post("/books", json={"isbn": "1234567890"})
+    response = client.post("/books", json={"isbn": "0306406152"})
     assert response.status_code == 200
     data = response.json()
     assert data["title"] == "Mock Title"
     assert data["author"] == "Mock Author"
 
 
+def test_add_books_batch(test_client, monkeypatch):
+    # Test post.(/books/batch) adds new books and reports a status for every ISBN
+    client, test_library = test_client
+    test_library.add_book(Book("Existing", "Author", "9780316769488", 1951))
+
+    async def mock_fetch(isbn):
+        if isbn == "9780000000002":
+            return None
+        return {
+            "title": f"Mock {isbn}",
+            "author": "Mock Author",
+            "isbn": isbn,
+            "publication_year": 2024,
+        }
+    monkeypatch.setattr(test_library, "fetch_book_from_api", mock_fetch)
+
+    response = client.post("/books/batch", json={"isbns": [
+        "978-0441172719", "9780316769488", "short", "9780000000002", "9780441172719"
+    ]})
+    assert response.status_code == 200
+    assert response.json() == [
+        {"isbn": "9780441172719", "status": "added"},
+        {"isbn": "9780316769488", "status": "exists"},
+        {"isbn": "short", "status": "invalid"},
+        {"isbn": "9780000000002", "status": "not_found"},
+        {"isbn": "9780441172719", "status": "exists"},
+    ]
+    assert test_library.find_book("9780441172719").title == "Mock 9780441172719"
+    assert len(test_library.books) == 2
+
+
+def test_api_without_orjson(monkeypatch):
+    # Test that the API can be imported and serves books when orjson is not installed
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    monkeypatch.setattr(library, "orjson", None)
+    try:
+        importlib.reload(api)
+        assert api.ResponseClass is api.JSONResponse
+        test_library = Library(lib_name=None)
+        test_library.add_book(Book("Rómulo", "Rómulo Macció", "9780593135211", 2021))
+        monkeypatch.setattr(api, "library", test_library)
+        client = TestClient(api.app)
+        assert client.get("/books").json()[0]["author"] == "Rómulo Macció"
+        assert client.get("/books/9780593135211").json()["title"] == "Rómulo"
+    finally:
+        monkeypatch.undo()
+        importlib.reload(api)
+
+
+def test_add_books_batch_too_large(test_client):
+    # Test post.(/books/batch) rejects batches larger than MAX_BATCH_SIZE
+    client, _ = test_client
+    response = client.post("/books/batch", json={"isbns": ["9780316769488"] * (MAX_BATCH_SIZE + 1)})
+    assert response.status_code == 422
+
+
+def test_add_books_by_isbn_limits_concurrent_lookups(monkeypatch):
+    # Test that a batch runs at most FETCH_CONCURRENCY Open Library lookups at the same time
+    lib = Library(lib_name=None)
+    running = 0
+    most_running = 0
+
+    async def mock_fetch(isbn):
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+        return None
+    monkeypatch.setattr(lib, "fetch_book_from_api", mock_fetch)
+
+    # Valid ISBN-13s: the check digit makes the weighted digit sum a multiple of 10
+    isbns = []
+    for i in range(50):
+        prefix = f"978000000{i:03d}"
+        check = -sum(int(c) * w for c, w in zip(prefix, (1, 3) * 6)) % 10
+        isbns.append(prefix + str(check))
+    asyncio.run(lib.add_books_by_isbn(isbns))
+    assert most_running == FETCH_CONCURRENCY
+
+
 def test_get_book_found(test_client):
     # Test get.(/books/{isbn}) returns the correct book
     client, test_library = test_client
     book = Book("Test Title", "Test Author", "9876543210", 2022)
-    test_library._books.append(book)
+    test_library.add_book(book)
 
     response = client.get(f"/books/{book.isbn}")
     assert response.status_code == 200
@@ -268,7 +840,7 @@ def test_delete_book(test_client):
     # Test delete.(/books/{isbn}) deletes a book successfully
     client, test_library = test_client
     book = Book("Delete Me", "Author", "5555555555", 2015)
-    test_library._books.append(book)
+    test_library.add_book(book)
 
     response = client.delete(f"/books/{book.isbn}")
     assert response.status_code == 200